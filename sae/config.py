@@ -43,6 +43,15 @@ class TrainConfig(Serializable):
 
     lr_warmup_steps: int = 1000
 
+    autocast: bool = True
+    """Run the SAE forward pass under bf16 autocast, keeping fp32 master weights.
+
+    This covers the encoder and the eager decoder; the Triton sparse decoder
+    always runs in the SAE's own dtype. Set to False for full fp32 numerics."""
+
+    compile_encoder: bool = False
+    """Use `torch.compile` on the eager encoder, instead of the default encoder."""
+
     auxk_alpha: float = 0.0
     """Weight of the auxiliary loss term."""
 
@@ -1,5 +1,5 @@
 """
-Copied from https://github.com/openai/sparse_autoencoder/blob/main/sparse_autoencoder/kernels.py
+Decoder kernels copied from https://github.com/openai/sparse_autoencoder/blob/main/sparse_autoencoder/kernels.py
 """
 
 import torch
@@ -426,3 +426,152 @@ class TritonDecoder(torch.autograd.Function):
             decoder_grad,
             None,
         )
+
+
+def triton_dense_encode(
+    x: torch.Tensor,
+    W_enc: torch.Tensor,
+    b_enc: torch.Tensor,
+    b_dec: torch.Tensor,
+    BLOCK_SIZE_M=64,
+    BLOCK_SIZE_N=64,
+    BLOCK_SIZE_K=32,
+) -> torch.Tensor:
+    """
+    calculates relu((x - b_dec) @ W_enc.T + b_enc) in a single kernel
+
+    x is shape (M, K)
+    W_enc is shape (N, K)
+    b_enc is shape (N,)
+    b_dec is shape (K,)
+
+    output is shape (M, N), with the dtype of W_enc
+
+    fp32 inputs only use TF32 tensor cores if torch's matmuls are allowed to, so
+    that we match the numerics of the eager encoder
+    """
+    M, K = x.shape
+    N = W_enc.shape[0]
+    assert W_enc.shape[1] == K
+    assert b_enc.is_contiguous() and b_dec.is_contiguous()
+
+    out = torch.empty(M, N, device=x.device, dtype=W_enc.dtype)
+
+    def grid(META):
+        return (
+            triton.cdiv(M, META["BLOCK_SIZE_M"]),
+            triton.cdiv(N, META["BLOCK_SIZE_N"]),
+        )
+
+    triton_dense_encode_kernel[grid](
+        x,
+        W_enc,
+        b_enc,
+        b_dec,
+        out,
+        stride_xm=x.stride(0),
+        stride_xk=x.stride(1),
+        stride_wn=W_enc.stride(0),
+        stride_wk=W_enc.stride(1),
+        stride_om=out.stride(0),
+        stride_on=out.stride(1),
+        M=M,
+        N=N,
+        K=K,
+        BLOCK_SIZE_M=BLOCK_SIZE_M,
+        BLOCK_SIZE_N=BLOCK_SIZE_N,
+        BLOCK_SIZE_K=BLOCK_SIZE_K,
+        INPUT_PRECISION="tf32" if torch.backends.cuda.matmul.allow_tf32 else "ieee",
+    )
+    return out
+
+
+@triton.jit
+def triton_dense_encode_kernel(
+    x_ptr,
+    w_ptr,
+    b_enc_ptr,
+    b_dec_ptr,
+    out_ptr,
+    stride_xm,
+    stride_xk,
+    stride_wn,
+    stride_wk,
+    stride_om,
+    stride_on,
+    M,
+    N,
+    K,
+    BLOCK_SIZE_M: tl.constexpr,
+    BLOCK_SIZE_N: tl.constexpr,
+    BLOCK_SIZE_K: tl.constexpr,
+    INPUT_PRECISION: tl.constexpr,
+):
+    """
+    x is shape (M, K)
+    w is shape (N, K)
+    b_enc is shape (N,)
+    b_dec is shape (K,)
+    out is shape (M, N)
+    """
+
+    pid_m = tl.program_id(0)
+    pid_n = tl.program_id(1)
+
+    offsets_m = pid_m * BLOCK_SIZE_M + tl.arange(0, BLOCK_SIZE_M)
+    offsets_n = pid_n * BLOCK_SIZE_N + tl.arange(0, BLOCK_SIZE_N)
+    offsets_k = tl.arange(0, BLOCK_SIZE_K)
+
+    accum = tl.zeros((BLOCK_SIZE_M, BLOCK_SIZE_N), dtype=tl.float32)
+
+    for k in range(0, tl.cdiv(K, BLOCK_SIZE_K)):
+        k_offsets = k * BLOCK_SIZE_K + offsets_k
+
+        x = tl.load(
+            x_ptr + offsets_m[:, None] * stride_xm + k_offsets[None, :] * stride_xk,
+            mask=(offsets_m[:, None] < M) & (k_offsets[None, :] < K),
+            other=0.0,
+        )  # shape (BLOCK_SIZE_M, BLOCK_SIZE_K)
+        b_dec = tl.load(b_dec_ptr + k_offsets, mask=k_offsets < K, other=0.0)
+        w = tl.load(
+            w_ptr + offsets_n[None, :] * stride_wn + k_offsets[:, None] * stride_wk,
+            mask=(offsets_n[None, :] < N) & (k_offsets[:, None] < K),
+            other=0.0,
+        )  # shape (BLOCK_SIZE_K, BLOCK_SIZE_N)
+
+        # Prologue: remove the decoder bias before the matmul
+        x = (x - b_dec[None, :]).to(w.dtype)
+        accum += tl.dot(x, w, input_precision=INPUT_PRECISION)
+
+    # Epilogue: add the encoder bias and apply the ReLU
+    b_enc = tl.load(b_enc_ptr + offsets_n, mask=offsets_n < N, other=0.0)
+    accum = tl.maximum(accum + b_enc[None, :], 0.0)
+
+    tl.store(
+        out_ptr + offsets_m[:, None] * stride_om + offsets_n[None, :] * stride_on,
+        accum.to(out_ptr.dtype.element_ty),
+        mask=(offsets_m[:, None] < M) & (offsets_n[None, :] < N),
+    )
+
+
+class TritonEncoder(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, x, encoder_weight, encoder_bias, decoder_bias):
+        out = triton_dense_encode(x, encoder_weight, encoder_bias, decoder_bias)
+        ctx.save_for_backward(x, encoder_weight, decoder_bias, out)
+        return out
+
+    @staticmethod
+    def backward(ctx, grad_output):
+        x, encoder_weight, decoder_bias, out = ctx.saved_tensors
+
+        # Gradient through the ReLU
+        grad_pre = grad_output * (out > 0)
+        grad_x = grad_pre @ encoder_weight
+
+        return (
+            grad_x,
+            grad_pre.mT @ (x - decoder_bias).to(grad_pre.dtype),
+            grad_pre.sum(0),
+            -grad_x.sum(0),
+        )
@@ -1,7 +1,95 @@
+import weakref
+
+import torch
+import torch.nn.functional as F
 from peft.tuners.lora import Linear as LoraLinear
+from torch import nn
+
+# Sibling projections which are fed the same input, so their LoRA A-projections can
+# be computed with a single GEMM
+FUSABLE_SIBLINGS = (
+    ("q_proj", "k_proj", "v_proj"),
+    ("gate_proj", "up_proj"),
+)
+
+
+class FusedLoraGroup:
+    """Computes the LoRA A-projections of several layers sharing an input at once.
+
+    The A weights of all members are concatenated along the rank dimension so that
+    the first member to see `x` issues one `[*, d_in] @ [d_in, sum(r)]` GEMM; the
+    other members then just pick their slice out of the cached result.
+    """
+
+    def __init__(self, members: list["LoraLinearWithHook"]):
+        self.members = members
+
+        # Concatenated A weights, plus the versions of the weights they were built
+        # from so that in-place updates (e.g. `load_state_dict`) invalidate them
+        self._weight: torch.Tensor | None = None
+        self._weight_key: tuple | None = None
+
+        # Split A-projections for the last input, and the members yet to read them
+        self._cache: tuple[weakref.ref, tuple[torch.Tensor, ...]] | None = None
+        self._unread: set[int] = set()
+
+    def __getstate__(self):
+        # The weakref in `_cache` can't be pickled, and none of this is worth saving
+        state = self.__dict__.copy()
+        state.update(_weight=None, _weight_key=None, _cache=None, _unread=set())
+        return state
+
+    def clear(self):
+        self._weight = self._weight_key = self._cache = None
+        self._unread.clear()
+
+    def lora_A_weight(self) -> torch.Tensor:
+        weights = [m.lora_A[m.active_adapters[0]].weight for m in self.members]
+
+        # Gradients have to flow back to each member's own weight, so we can't
+        # reuse a concatenation from an earlier graph
+        if torch.is_grad_enabled() and any(w.requires_grad for w in weights):
+            return torch.cat(weights)
+
+        key = tuple((w.data_ptr(), w._version) for w in weights)
+        if self._weight is None or self._weight_key != key:
+            self._weight, self._weight_key = torch.cat(weights), key
+
+        return self._weight
+
+    def lora_A_result(self, member: "LoraLinearWithHook", x: torch.Tensor):
+        if self._cache is None or self._cache[0]() is not x:
+            weight = self.lora_A_weight()
+            sizes = [m.lora_A[m.active_adapters[0]].out_features for m in self.members]
+            self._cache = (weakref.ref(x), F.linear(x, weight).split(sizes, -1))
+            self._unread = set(range(len(self.members)))
+
+        idx = self.members.index(member)
+        out = self._cache[1][idx]
+
+        # Drop the cache, and the autograd graph it holds on to, once every member
+        # has read its slice
+        self._unread.discard(idx)
+        if not self._unread:
+            self._cache = None
+
+        return out
 
 
 class LoraLinearWithHook(LoraLinear):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Set by `replace_lora_linear` when siblings share our input
+        self._lora_group: FusedLoraGroup | None = None
+
+    def train(self, mode: bool = True):
+        # The adapter weights may change once we leave eval mode
+        if self._lora_group is not None:
+            self._lora_group.clear()
+
+        return super().train(mode)
+
     def compute_lora_result(self, x):
         adapter_name = self.active_adapters[0]
         dropout = self.lora_dropout[adapter_name]
@@ -9,40 +97,99 @@ class LoraLinearWithHook(LoraLinear):
         lora_B_module = self.lora_B[adapter_name]
         scaling = self.scaling[adapter_name]
 
+        # Each member has its own dropout mask, so we can only share the
+        # A-projection when dropout is a no-op. When merged, the forward pass doesn't
+        # run the LoRA branch, so the siblings might never read their slices.
+        if (
+            self._lora_group is not None
+            and not self.merged
+            and (not self.training or isinstance(dropout, nn.Identity))
+        ):
+            return lora_B_module(self._lora_group.lora_A_result(self, x)) * scaling
+
         h = dropout(x)
         out = lora_B_module(lora_A_module(h)) * scaling
         return out
 
     def forward(self, x):
+        # After an explicit `merge()` the LoRA delta lives in the base weight, so the
+        # whole layer is a single GEMM. `compute_lora_result` still works for hooks.
+        if self.merged:
+            return self.base_layer(x)
+
         result = self.base_layer(x)
         lora_result = self.compute_lora_result(x)
         return result + lora_result
 
 
+def _with_hook(child: LoraLinear) -> LoraLinearWithHook:
+    adapter_name = child.active_adapters[0]
+    new_module = LoraLinearWithHook(
+        base_layer=child.base_layer,
+        adapter_name=adapter_name,
+        in_features=child.in_features,
+        out_features=child.out_features,
+        r=child.r[adapter_name],
+        lora_alpha=child.lora_alpha[adapter_name],
+        # peft uses an `nn.Identity` when dropout is disabled
+        lora_dropout=getattr(child.lora_dropout[adapter_name], "p", 0.0),
+        fan_in_fan_out=child.fan_in_fan_out,
+        bias=child.base_layer.bias is not None,
+        init_lora_weights=False,
+    )
+
+    new_module.base_layer.weight = child.base_layer.weight
+    if child.base_layer.bias is not None:
+        new_module.base_layer.bias = child.base_layer.bias
+
+    new_module.lora_A = child.lora_A
+    new_module.lora_B = child.lora_B
+    new_module.scaling = child.scaling
+    return new_module
+
+
 def replace_lora_linear(module):
-    for name, child in module.named_children():
-        if isinstance(child, LoraLinear):
-            adapter_name = child.active_adapters[0]
-            new_module = LoraLinearWithHook(
-                base_layer=child.base_layer,
-                adapter_name=adapter_name,
-                in_features=child.in_features,
-                out_features=child.out_features,
-                r=child.r[adapter_name],
-                lora_alpha=child.lora_alpha[adapter_name],
-                lora_dropout=child.lora_dropout[adapter_name].p,
-                fan_in_fan_out=child.fan_in_fan_out,
-                bias=child.base_layer.bias is not None,
-                init_lora_weights=False,
-            )
-
-            new_module.base_layer.weight = child.base_layer.weight
-            if child.base_layer.bias is not None:
-                new_module.base_layer.bias = child.base_layer.bias
-
-            new_module.lora_A = child.lora_A
-            new_module.lora_B = child.lora_B
-            new_module.scaling = child.scaling
-            setattr(module, name, new_module)
-        else:
-            replace_lora_linear(child)
+    # Iterative walk so deep models don't pile up Python frames. We never need to
+    # descend into LoRA layers, including ones we've already replaced.
+    stack = [module]
+    while stack:
+        parent = stack.pop()
+        for name, child in parent.named_children():
+            if isinstance(child, LoraLinearWithHook):
+                continue
+            elif isinstance(child, LoraLinear):
+                setattr(parent, name, _with_hook(child))
+            else:
+                stack.append(child)
+
+        for names in FUSABLE_SIBLINGS:
+            members = [getattr(parent, name, None) for name in names]
+            if not all(isinstance(m, LoraLinearWithHook) for m in members):
+                continue
+
+            # We can only concatenate the A weights if they have the same width, which
+            # isn't the case in cross-attention over encoder states of another width
+            if len({(m.in_features, m.active_adapters[0]) for m in members}) == 1:
+                group = FusedLoraGroup(members)
+                for member in members:
+                    member._lora_group = group
+
+
+@torch.no_grad()
+def merge_lora_into_base(module):
+    """Fold every LoRA delta into its base weight and swap in the base layer.
+
+    This removes the LoRA layers entirely, so it's only useful for pure inference
+    where we don't need to hook the LoRA branch.
+    """
+    stack = [module]
+    while stack:
+        parent = stack.pop()
+        for name, child in parent.named_children():
+            if isinstance(child, LoraLinearWithHook):
+                # Layers may already have been merged explicitly
+                if not child.merged:
+                    child.merge()
+                setattr(parent, name, child.base_layer)
+            else:
+                stack.append(child)
@@ -3,15 +3,20 @@ from fnmatch import fnmatch
 from pathlib import Path
 from typing import NamedTuple
 
-import einops
 import torch
 from huggingface_hub import snapshot_download
 from natsort import natsorted
 from safetensors.torch import load_model, save_model
 from torch import Tensor, nn
+from torch.nn.utils import skip_init
 
 from .config import SaeConfig
-from .utils import decoder_impl
+from .utils import (
+    compiled_eager_encode,
+    decoder_impl,
+    encoder_impl,
+    sum_of_squares,
+)
 
 
 class EncoderOutput(NamedTuple):
@@ -50,15 +55,23 @@ class Sae(nn.Module):
         dtype: torch.dtype | None = None,
         *,
         decoder: bool = True,
+        compile_encoder: bool = False,
     ):
         super().__init__()
         self.cfg = cfg
         self.d_in = d_in
+
+        # A runtime setting rather than part of `cfg`, so that it isn't saved along
+        # with the weights and silently turned on for everyone who loads them
+        self.compile_encoder = compile_encoder
         self.num_latents = cfg.num_latents or d_in * cfg.expansion_factor
 
         self.encoder = nn.Linear(d_in, self.num_latents, device=device, dtype=dtype)
         self.encoder.bias.data.zero_()
 
+        # Scratch space for the decoder row norms, reused across steps
+        self._norm_buf: Tensor | None = None
+
         self.W_dec = nn.Parameter(self.encoder.weight.data.clone()) if decoder else None
         if decoder and self.cfg.normalize_decoder:
             self.set_decoder_norm_to_unit_norm()
@@ -135,7 +148,9 @@ class Sae(nn.Module):
             d_in = cfg_dict.pop("d_in")
             cfg = SaeConfig.from_dict(cfg_dict, drop_extra_fields=True)
 
-        sae = Sae(d_in, cfg, device=device, decoder=decoder)
+        # Every parameter is about to be overwritten, so don't waste time and memory
+        # on the random init and decoder normalization
+        sae = skip_init(Sae, d_in, cfg, device=device, decoder=decoder)
         load_model(
             model=sae,
             filename=str(path / "sae.safetensors"),
@@ -168,11 +183,10 @@ class Sae(nn.Module):
         return self.encoder.weight.dtype
 
     def pre_acts(self, x: Tensor) -> Tensor:
-        # Remove decoder bias as per Anthropic
-        sae_in = x.to(self.dtype) - self.b_dec
-        out = self.encoder(sae_in)
-
-        return nn.functional.relu(out)
+        # Remove decoder bias as per Anthropic. The encoder implementations cast `x`
+        # as part of that subtraction, so we don't make a copy in our dtype here.
+        encode = compiled_eager_encode() if self.compile_encoder else encoder_impl
+        return encode(x, self.encoder.weight, self.encoder.bias, self.b_dec)
 
     def select_topk(self, latents: Tensor) -> EncoderOutput:
         """Select the top-k latents."""
@@ -185,10 +199,16 @@ class Sae(nn.Module):
     def decode(self, top_acts: Tensor, top_indices: Tensor) -> Tensor:
         assert self.W_dec is not None, "Decoder weight was not initialized."
 
-        y = decoder_impl(top_indices, top_acts.to(self.dtype), self.W_dec.mT)
-        return y + self.b_dec
+        return decoder_impl(
+            top_indices, top_acts.to(self.dtype), self.W_dec.mT, self.b_dec
+        )
 
-    def forward(self, x: Tensor, dead_mask: Tensor | None = None) -> ForwardOutput:
+    def forward(
+        self,
+        x: Tensor,
+        dead_mask: Tensor | None = None,
+        dead_idx: Tensor | None = None,
+    ) -> ForwardOutput:
         pre_acts = self.pre_acts(x)
 
         # Decode and compute residual
@@ -196,11 +216,16 @@ class Sae(nn.Module):
         sae_out = self.decode(top_acts, top_indices)
         e = sae_out - x
 
-        # Used as a denominator for putting everything on a reasonable scale
-        total_variance = (x - x.mean(0)).pow(2).sum()
+        # Used as a denominator for putting everything on a reasonable scale. We
+        # always accumulate the losses in fp32, even if the matmuls run in bf16.
+        total_variance = sum_of_squares(x - x.mean(0))
 
-        # Second decoder pass for AuxK loss
-        if dead_mask is not None and (num_dead := int(dead_mask.sum())) > 0:
+        # Second decoder pass for AuxK loss. Getting the indices of the dead latents
+        # costs a device sync, so callers can pass in ones they've computed already.
+        if dead_idx is None and dead_mask is not None:
+            dead_idx = dead_mask.nonzero()[:, 0]
+
+        if dead_idx is not None and (num_dead := len(dead_idx)) > 0:
             # Heuristic from Appendix B.1 in the paper
             k_aux = x.shape[-1] // 2
 
@@ -208,30 +233,36 @@ class Sae(nn.Module):
             scale = min(num_dead / k_aux, 1.0)
             k_aux = min(k_aux, num_dead)
 
-            # Don't include living latents in this loss
-            auxk_latents = torch.where(dead_mask[None], pre_acts, -torch.inf)
-
-            # Top-k dead latents
-            auxk_acts, auxk_indices = auxk_latents.topk(k_aux, sorted=False)
+            # Top-k dead latents, not including living latents in this loss
+            if dead_mask is not None and num_dead > 0.3 * self.num_latents:
+                # Most latents are dead, so masking the dense pre-acts is cheapest
+                auxk_latents = torch.where(dead_mask[None], pre_acts, -torch.inf)
+                auxk_acts, auxk_indices = auxk_latents.topk(k_aux, sorted=False)
+            else:
+                # Only gather the dead columns, then map back to latent indices
+                auxk_latents = pre_acts.index_select(-1, dead_idx)
+                auxk_acts, auxk_indices = auxk_latents.topk(k_aux, sorted=False)
+                auxk_indices = dead_idx[auxk_indices]
 
             # Encourage the top ~50% of dead latents to predict the residual of the
             # top k living latents
             e_hat = self.decode(auxk_acts, auxk_indices)
-            auxk_loss = (e_hat - e).pow(2).sum()
+            auxk_loss = sum_of_squares(e_hat - e)
             auxk_loss = scale * auxk_loss / total_variance
         else:
-            auxk_loss = sae_out.new_tensor(0.0)
+            # Unlike `new_tensor`, this doesn't need a host-to-device copy
+            auxk_loss = total_variance.new_zeros(())
 
-        l2_loss = e.pow(2).sum()
+        l2_loss = sum_of_squares(e)
         fvu = l2_loss / total_variance
 
         if self.cfg.multi_topk:
             top_acts, top_indices = pre_acts.topk(4 * self.cfg.k, sorted=False)
             sae_out = self.decode(top_acts, top_indices)
 
-            multi_topk_fvu = (sae_out - x).pow(2).sum() / total_variance
+            multi_topk_fvu = sum_of_squares(sae_out - x) / total_variance
         else:
-            multi_topk_fvu = sae_out.new_tensor(0.0)
+            multi_topk_fvu = total_variance.new_zeros(())
 
         return ForwardOutput(
             sae_out,
@@ -246,22 +277,22 @@ class Sae(nn.Module):
     def set_decoder_norm_to_unit_norm(self):
         assert self.W_dec is not None, "Decoder weight was not initialized."
 
-        eps = torch.finfo(self.W_dec.dtype).eps
-        norm = torch.norm(self.W_dec.data, dim=1, keepdim=True)
-        self.W_dec.data /= norm + eps
+        W_dec = self.W_dec.data
+        buf = self._norm_buf
+        if buf is None or buf.device != W_dec.device or buf.dtype != W_dec.dtype:
+            buf = self._norm_buf = W_dec.new_empty(len(W_dec), 1)
+
+        eps = torch.finfo(W_dec.dtype).eps
+        norm = torch.linalg.vector_norm(W_dec, dim=1, keepdim=True, out=buf)
+        W_dec.div_(norm.add_(eps))
 
     @torch.no_grad()
     def remove_gradient_parallel_to_decoder_directions(self):
         assert self.W_dec is not None, "Decoder weight was not initialized."
         assert self.W_dec.grad is not None  # keep pyright happy
 
-        parallel_component = einops.einsum(
-            self.W_dec.grad,
-            self.W_dec.data,
-            "d_sae d_in, d_sae d_in -> d_sae",
-        )
-        self.W_dec.grad -= einops.einsum(
-            parallel_component,
-            self.W_dec.data,
-            "d_sae, d_sae d_in -> d_sae d_in",
-        )
+        W_dec, grad = self.W_dec.data, self.W_dec.grad
+        # Row-wise dot products and an in-place multiply-subtract, so that neither
+        # step allocates a temporary as large as W_dec
+        parallel_component = torch.einsum("ij,ij->i", grad, W_dec)
+        grad.addcmul_(parallel_component.unsqueeze(-1), W_dec, value=-1.0)
@@ -17,7 +17,7 @@ from transformers import PreTrainedModel, get_linear_schedule_with_warmup
 from .config import TrainConfig
 from .data import MemmapDataset
 from .sae import Sae
-from .utils import geometric_median, get_layer_list, resolve_widths
+from .utils import geometric_median, get_layer_list, no_sync_if, resolve_widths
 from .lora import LoraLinearWithHook
 
 
@@ -67,7 +67,12 @@ class SaeTrainer:
 
         self.model = model
         self.saes = {
-            hook: Sae(input_widths[hook], cfg.sae, device)
+            hook: Sae(
+                input_widths[hook],
+                cfg.sae,
+                device,
+                compile_encoder=cfg.compile_encoder,
+            )
             for hook in self.local_hookpoints()
         }
 
@@ -180,6 +185,9 @@ class SaeTrainer:
         }
         num_tokens_in_step = 0
 
+        # The dead latents only change when we take a step
+        dead_masks = self.dead_masks()
+
         # For logging purposes
         avg_auxk_loss = defaultdict(float)
         avg_fvu = defaultdict(float)
@@ -199,7 +207,8 @@ class SaeTrainer:
 
             name = module_to_name[module]
             if isinstance(module, LoraLinearWithHook):
-                outputs = module.compute_lora_result(inputs)
+                # The LoRA branch may be merged into the base weight, so recompute it
+                outputs = module.compute_lora_result(inputs[0])
             hidden_dict[name] = outputs.flatten(0, 1)
 
         for batch in dl:
@@ -222,6 +231,9 @@ class SaeTrainer:
             if self.cfg.distribute_modules:
                 hidden_dict = self.scatter_hiddens(hidden_dict)
 
+            # Check if we need to actually do a training step after this batch
+            step, substep = divmod(self.global_step + 1, self.cfg.grad_acc_steps)
+
             for name, hiddens in hidden_dict.items():
                 raw = self.saes[name]  # 'raw' never has a DDP wrapper
 
@@ -233,7 +245,7 @@ class SaeTrainer:
                     # across all ranks with the mean (median?) of the geometric medians
                     # on each rank. Not clear if that would hurt performance.
                     median = geometric_median(self.maybe_all_cat(hiddens))
-                    raw.b_dec.data = median.to(raw.dtype)
+                    raw.b_dec.data.copy_(median)
 
                 if not maybe_wrapped:
                     # Wrap the SAEs with Distributed Data Parallel. We have to do this
@@ -248,50 +260,53 @@ class SaeTrainer:
                         else self.saes
                     )
 
-                # Make sure the W_dec is still unit-norm
-                if raw.cfg.normalize_decoder:
-                    raw.set_decoder_norm_to_unit_norm()
-
                 acc_steps = self.cfg.grad_acc_steps * self.cfg.micro_acc_steps
                 denom = acc_steps * self.cfg.wandb_log_frequency
                 wrapped = maybe_wrapped[name]
 
+                dead_mask, dead_idx = dead_masks.get(name, (None, None))
+
                 # Save memory by chunking the activations
-                for chunk in hiddens.chunk(self.cfg.micro_acc_steps):
-                    out = wrapped(
-                        chunk,
-                        dead_mask=(
-                            self.num_tokens_since_fired[name]
-                            > self.cfg.dead_feature_threshold
-                            if self.cfg.auxk_alpha > 0
-                            else None
-                        ),
-                    )
+                chunks = hiddens.chunk(self.cfg.micro_acc_steps)
+                for i, chunk in enumerate(chunks):
+                    # Only all-reduce the gradients on the last microbatch before a
+                    # step, instead of on every backward pass
+                    accumulating = substep != 0 or i < len(chunks) - 1
+
+                    with no_sync_if(wrapped, accumulating), torch.autocast(
+                        device.type, dtype=torch.bfloat16, enabled=self.cfg.autocast
+                    ):
+                        out = wrapped(chunk, dead_mask=dead_mask, dead_idx=dead_idx)
 
                     avg_fvu[name] += float(
                         self.maybe_all_reduce(out.fvu.detach()) / denom
                     )
+
+                    # Only add the auxiliary terms that are actually enabled, rather
+                    # than scaling and adding zeros
+                    loss = out.fvu
                     if self.cfg.auxk_alpha > 0:
                         avg_auxk_loss[name] += float(
                             self.maybe_all_reduce(out.auxk_loss.detach()) / denom
                         )
+                        loss = loss + self.cfg.auxk_alpha * out.auxk_loss
                     if self.cfg.sae.multi_topk:
                         avg_multi_topk_fvu[name] += float(
                             self.maybe_all_reduce(out.multi_topk_fvu.detach()) / denom
                         )
+                        loss = loss + out.multi_topk_fvu / 8
 
-                    loss = out.fvu + self.cfg.auxk_alpha * out.auxk_loss + out.multi_topk_fvu / 8
                     loss.div(acc_steps).backward()
 
                     # Update the did_fire mask
                     did_fire[name][out.latent_indices.flatten()] = True
-                    self.maybe_all_reduce(did_fire[name], "max")  # max is boolean "any"
 
-                # Clip gradient norm independently for each SAE
-                torch.nn.utils.clip_grad_norm_(raw.parameters(), 1.0)
+                # Clip gradient norm independently for each SAE. Under `no_sync` each
+                # rank only holds its own partial gradients, whose norms differ, so we
+                # wait for the synced backward before the step to clip consistently.
+                if substep == 0:
+                    torch.nn.utils.clip_grad_norm_(raw.parameters(), 1.0)
 
-            # Check if we need to actually do a training step
-            step, substep = divmod(self.global_step + 1, self.cfg.grad_acc_steps)
             if substep == 0:
                 if self.cfg.sae.normalize_decoder:
                     for sae in self.saes.values():
@@ -301,10 +316,18 @@ class SaeTrainer:
                 self.optimizer.zero_grad()
                 self.lr_scheduler.step()
 
+                # Make sure the W_dec is still unit-norm. It only changes here, so
+                # there's no need to rescan it before every forward pass.
+                if self.cfg.sae.normalize_decoder:
+                    for sae in self.saes.values():
+                        sae.set_decoder_norm_to_unit_norm()
+
                 ###############
                 with torch.no_grad():
-                    # Update the dead feature mask
+                    # Update the dead feature mask. We only need to sync which
+                    # latents fired once per step, not after every microbatch.
                     for name, counts in self.num_tokens_since_fired.items():
+                        self.maybe_all_reduce(did_fire[name], "max")  # boolean "any"
                         counts += num_tokens_in_step
                         counts[did_fire[name]] = 0
 
@@ -313,6 +336,8 @@ class SaeTrainer:
                     for mask in did_fire.values():
                         mask.zero_()
 
+                    dead_masks = self.dead_masks()
+
                 if (
                     self.cfg.log_to_wandb
                     and (step + 1) % self.cfg.wandb_log_frequency == 0
@@ -359,6 +384,24 @@ class SaeTrainer:
         self.save()
         pbar.close()
 
+    def dead_masks(self) -> dict[str, tuple[Tensor, Tensor]]:
+        """Masks and indices of the dead latents for the AuxK loss.
+
+        Only SAEs with dead latents get an entry. Finding the indices once per step
+        here spares every SAE forward pass from having to sync with the device.
+        """
+        if self.cfg.auxk_alpha <= 0:
+            return {}
+
+        masks = {}
+        for name, counts in self.num_tokens_since_fired.items():
+            mask = counts > self.cfg.dead_feature_threshold
+            idx = mask.nonzero()[:, 0]
+            if len(idx):
+                masks[name] = mask, idx
+
+        return masks
+
     def local_hookpoints(self) -> list[str]:
         return (
             self.module_plan[dist.get_rank()]
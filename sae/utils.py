@@ -1,9 +1,12 @@
 import os
+from contextlib import AbstractContextManager, nullcontext
+from functools import cache
 from typing import Any, Type, TypeVar, cast
 
 import torch
 from accelerate.utils import send_to_device
 from torch import Tensor, nn
+from torch.nn.parallel import DistributedDataParallel as DDP
 from transformers import PreTrainedModel
 
 T = TypeVar("T")
@@ -17,27 +20,45 @@ def assert_type(typ: Type[T], obj: Any) -> T:
     return cast(typ, obj)
 
 
+def no_sync_if(module: nn.Module, accumulate: bool) -> AbstractContextManager:
+    """Skip the DDP gradient all-reduce while we're still accumulating gradients.
+
+    The forward pass must run inside the returned context for this to take effect.
+    """
+    if accumulate and isinstance(module, DDP):
+        return module.no_sync()
+
+    return nullcontext()
+
+
 @torch.no_grad()
 def geometric_median(points: Tensor, max_iter: int = 100, tol: float = 1e-5):
     """Compute the geometric median `points`. Used for initializing decoder bias."""
+    # `cdist` has no half precision kernels, and the weighted sums below are more
+    # accurate in fp32 anyway. This upcast is the only allocation as large as
+    # `points`; the loop below doesn't make any.
+    points = points.to(torch.promote_types(points.dtype, torch.float32))
+
     # Initialize our guess as the mean of the points
     guess = points.mean(dim=0)
-    prev = torch.zeros_like(guess)
-
-    # Weights for iteratively reweighted least squares
-    weights = torch.ones(len(points), device=points.device)
 
     for _ in range(max_iter):
         prev = guess
 
-        # Compute the weights
-        weights = 1 / torch.norm(points - guess, dim=1)
+        # Compute the weights for iteratively reweighted least squares. `cdist`
+        # computes the distances pairwise without materializing `points - guess`;
+        # the matmul-based variant is too imprecise for points near the median.
+        weights = torch.cdist(
+            points, guess[None], compute_mode="donot_use_mm_for_euclid_dist"
+        )
+        weights = weights.squeeze(1).reciprocal_()
 
         # Normalize the weights
         weights /= weights.sum()
 
-        # Compute the new geometric median
-        guess = (weights.unsqueeze(1) * points).sum(dim=0)
+        # Compute the new geometric median. A matvec avoids materializing the
+        # weighted points, which are as large as `points` itself.
+        guess = weights @ points
 
         # Early stopping condition
         if torch.norm(guess - prev) < tol:
@@ -46,6 +67,11 @@ def geometric_median(points: Tensor, max_iter: int = 100, tol: float = 1e-5):
     return guess
 
 
+def sum_of_squares(x: Tensor) -> Tensor:
+    """Sum of squares of `x` accumulated in fp32, without materializing `x ** 2`."""
+    return torch.linalg.vector_norm(x, dtype=torch.float32).square()
+
+
 def get_layer_list(model: PreTrainedModel) -> tuple[str, nn.ModuleList]:
     """Get the list of layers to train SAEs on."""
     N = assert_type(int, model.config.num_hidden_layers)
@@ -90,26 +116,79 @@ def resolve_widths(
     return shapes
 
 
+# Fallback implementation of SAE encoder
+def eager_encode(x: Tensor, W_enc: Tensor, b_enc: Tensor, b_dec: Tensor):
+    # Let the subtraction do any dtype promotion of `x`, rather than copying it first
+    sae_in = (x - b_dec).to(W_enc.dtype)
+    return nn.functional.relu(nn.functional.linear(sae_in, W_enc, b_enc))
+
+
+@cache
+def compiled_eager_encode():
+    """`eager_encode` compiled with `torch.compile`.
+
+    The encoder is memory-bound on its [batch, num_latents] output, so we let
+    Inductor fuse the bias subtraction and ReLU around the GEMM. Shapes are fixed
+    across steps so there's no need for dynamic shape support.
+    """
+    return torch.compile(eager_encode, dynamic=False)
+
+
+# Triton implementation of SAE encoder, fusing the bias subtraction and ReLU into
+# the GEMM so the pre-activations only make one round trip to memory
+def triton_encode(x: Tensor, W_enc: Tensor, b_enc: Tensor, b_dec: Tensor):
+    if not x.is_cuda:
+        return eager_encode(x, W_enc, b_enc, b_dec)
+
+    # Match the dtype `nn.functional.linear` would run in under autocast
+    if torch.is_autocast_enabled("cuda"):
+        W_enc = W_enc.to(torch.get_autocast_dtype("cuda"))
+
+    out = TritonEncoder.apply(x.flatten(0, -2), W_enc, b_enc, b_dec)
+    return out.unflatten(0, x.shape[:-1])
+
+
 # Fallback implementation of SAE decoder
-def eager_decode(top_indices: Tensor, top_acts: Tensor, W_dec: Tensor):
+def eager_decode(
+    top_indices: Tensor, top_acts: Tensor, W_dec: Tensor, bias: Tensor | None = None
+):
     buf = top_acts.new_zeros(top_acts.shape[:-1] + (W_dec.shape[-1],))
     acts = buf.scatter_(dim=-1, index=top_indices, src=top_acts)
-    return acts @ W_dec.mT
+    if bias is None:
+        return acts @ W_dec.mT
+
+    # Fuse the bias add into the GEMM
+    out = torch.addmm(bias, acts.reshape(-1, acts.shape[-1]), W_dec.mT)
+    return out.view(*acts.shape[:-1], -1)
 
 
 # Triton implementation of SAE decoder
-def triton_decode(top_indices: Tensor, top_acts: Tensor, W_dec: Tensor):
-    return TritonDecoder.apply(top_indices, top_acts, W_dec)
+def triton_decode(
+    top_indices: Tensor, top_acts: Tensor, W_dec: Tensor, bias: Tensor | None = None
+):
+    out = TritonDecoder.apply(top_indices, top_acts, W_dec)
+
+    # The kernel's output is a fresh buffer, so we can add the bias in place
+    return out if bias is None else out.add_(bias)
 
 
 try:
-    from .kernels import TritonDecoder
+    from .kernels import TritonDecoder, TritonEncoder
 except ImportError:
     decoder_impl = eager_decode
+    encoder_impl = eager_encode
     print("Triton not installed, using eager implementation of SAE decoder.")
 else:
     if os.environ.get("SAE_DISABLE_TRITON") == "1":
         print("Triton disabled, using eager implementation of SAE decoder.")
         decoder_impl = eager_decode
+        encoder_impl = eager_encode
     else:
         decoder_impl = triton_decode
+
+        # The fused encoder is opt-in, since cuBLAS is hard to beat on large GEMMs
+        encoder_impl = (
+            triton_encode
+            if os.environ.get("SAE_TRITON_ENCODER") == "1"
+            else eager_encode
+        )
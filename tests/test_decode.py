@@ -18,3 +18,13 @@ def test_decode():
     triton_res = triton_decode(top_idx, top_vals, W_dec.mT)
 
     torch.testing.assert_allclose(eager_res, triton_res)
+
+    # With the decoder bias fused in
+    b_dec = torch.randn(d_in, device="cuda")
+    eager_res = eager_decode(top_idx, top_vals, W_dec.mT, b_dec)
+    triton_res = triton_decode(top_idx, top_vals, W_dec.mT, b_dec)
+
+    torch.testing.assert_allclose(eager_res, triton_res)
+
+    unfused_res = eager_decode(top_idx, top_vals, W_dec.mT) + b_dec
+    torch.testing.assert_allclose(eager_res, unfused_res)
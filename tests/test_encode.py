@@ -0,0 +1,27 @@
+import torch
+
+from sae.utils import eager_encode, triton_encode
+
+
+def test_encode():
+    batch = 70
+    d_in = 50
+    d_sae = 100
+
+    # Fake data
+    x = torch.randn(batch, d_in, device="cuda", requires_grad=True)
+    W_enc = torch.randn(d_sae, d_in, device="cuda", requires_grad=True)
+    b_enc = torch.randn(d_sae, device="cuda", requires_grad=True)
+    b_dec = torch.randn(d_in, device="cuda", requires_grad=True)
+
+    eager_res = eager_encode(x, W_enc, b_enc, b_dec)
+    triton_res = triton_encode(x, W_enc, b_enc, b_dec)
+    torch.testing.assert_close(eager_res, triton_res, atol=1e-4, rtol=1e-4)
+
+    # Compare gradients
+    grad = torch.randn_like(eager_res)
+    eager_grads = torch.autograd.grad(eager_res, (x, W_enc, b_enc, b_dec), grad)
+    triton_grads = torch.autograd.grad(triton_res, (x, W_enc, b_enc, b_dec), grad)
+
+    for eager_grad, triton_grad in zip(eager_grads, triton_grads):
+        torch.testing.assert_close(eager_grad, triton_grad, atol=1e-4, rtol=1e-4)
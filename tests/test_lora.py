@@ -0,0 +1,135 @@
+import copy
+import pickle
+
+import torch
+from peft import LoraConfig, get_peft_model
+from torch import nn
+
+from sae.lora import LoraLinearWithHook, merge_lora_into_base, replace_lora_linear
+
+
+class Block(nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.q_proj = nn.Linear(16, 16)
+        self.k_proj = nn.Linear(16, 8)
+        self.v_proj = nn.Linear(16, 8)
+        self.o_proj = nn.Linear(32, 16)
+
+    def forward(self, x):
+        q, k, v = self.q_proj(x), self.k_proj(x), self.v_proj(x)
+        return self.o_proj(torch.cat([q, k, v], dim=-1))
+
+
+def make_models():
+    torch.manual_seed(0)
+    model = nn.Sequential(Block(), Block())
+    config = LoraConfig(
+        r=4,
+        target_modules=["q_proj", "k_proj", "v_proj", "o_proj"],
+        # Random B so that the LoRA delta is nonzero
+        init_lora_weights=False,
+    )
+    peft_model = get_peft_model(model, config).eval()
+
+    hooked = copy.deepcopy(peft_model)
+    replace_lora_linear(hooked)
+    return peft_model, hooked
+
+
+def test_forward_matches_peft():
+    peft_model, hooked = make_models()
+    x = torch.randn(2, 5, 16)
+
+    assert any(isinstance(m, LoraLinearWithHook) for m in hooked.modules())
+    torch.testing.assert_close(hooked(x), peft_model(x))
+
+    # Without grad the concatenated A weights are cached across calls
+    with torch.no_grad():
+        for _ in range(2):
+            torch.testing.assert_close(hooked(x), peft_model(x))
+
+
+def test_grouped_lora_result_matches_peft():
+    peft_model, hooked = make_models()
+    x = torch.randn(2, 5, 16)
+
+    for name in ["q_proj", "k_proj", "v_proj"]:
+        layer = hooked.get_submodule(f"base_model.model.0.{name}")
+        assert layer._lora_group is not None
+
+        ref = peft_model.get_submodule(f"base_model.model.0.{name}")
+        expected = ref.lora_B["default"](ref.lora_A["default"](x))
+        expected = expected * ref.scaling["default"]
+        torch.testing.assert_close(layer.compute_lora_result(x), expected)
+
+    # Gradients still reach each member's own A weight
+    hooked.train()
+    hooked(x).sum().backward()
+    for name in ["q_proj", "k_proj", "v_proj"]:
+        layer = hooked.get_submodule(f"base_model.model.0.{name}")
+        assert layer.lora_A["default"].weight.grad is not None
+
+
+def test_siblings_of_different_widths_are_not_grouped():
+    torch.manual_seed(0)
+    block = Block()
+    # Cross-attention, where k and v see encoder states of another width
+    block.k_proj, block.v_proj = nn.Linear(24, 8), nn.Linear(24, 8)
+    config = LoraConfig(r=4, target_modules=["q_proj", "k_proj", "v_proj"])
+    hooked = get_peft_model(block, config)
+    replace_lora_linear(hooked)
+
+    for name in ["q_proj", "k_proj", "v_proj"]:
+        layer = hooked.get_submodule(f"base_model.model.{name}")
+        assert layer._lora_group is None
+
+    layer.compute_lora_result(torch.randn(2, 5, 24))
+
+
+def test_pickle_with_partially_read_group():
+    _, hooked = make_models()
+    x = torch.randn(2, 5, 16)
+
+    # Only one member reads its slice, so the group still holds the others
+    with torch.no_grad():
+        hooked.get_submodule("base_model.model.0.q_proj").compute_lora_result(x)
+
+    torch.testing.assert_close(pickle.loads(pickle.dumps(hooked))(x), hooked(x))
+
+
+def test_merge_lora_into_base_matches_peft():
+    peft_model, hooked = make_models()
+    x = torch.randn(2, 5, 16)
+
+    merge_lora_into_base(hooked)
+    assert not any(isinstance(m, LoraLinearWithHook) for m in hooked.modules())
+    torch.testing.assert_close(hooked(x), peft_model(x))
+
+
+def test_merge_lora_into_base_after_merge():
+    peft_model, hooked = make_models()
+    x = torch.randn(2, 5, 16)
+
+    for layer in hooked.modules():
+        if isinstance(layer, LoraLinearWithHook):
+            layer.merge()
+
+    # Already merged deltas must not be added to the base weights a second time
+    merge_lora_into_base(hooked)
+    torch.testing.assert_close(hooked(x), peft_model(x))
+
+
+def test_merge_matches_peft():
+    peft_model, hooked = make_models()
+    x = torch.randn(2, 5, 16)
+    expected = peft_model(x)
+
+    layers = [m for m in hooked.modules() if isinstance(m, LoraLinearWithHook)]
+    for layer in layers:
+        layer.merge()
+    torch.testing.assert_close(hooked(x), expected)
+
+    for layer in layers:
+        layer.unmerge()
+    torch.testing.assert_close(hooked(x), expected)